@@ -1,6 +1,7 @@
 import json
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import bcdata
 
@@ -15,11 +16,13 @@ with open("primary_keys.json", "r") as file:
     bcdata_tables = set([t.lower() for t in bcdata.list_tables()])
     if pk_db_tables.issubset(bcdata_tables):
         log.info("Table names in primary_keys.json are valid")
-        for table in primary_keys:
-            column = primary_keys[table]
-            schema = bcdata.get_table_definition(table)["schema"]
-            if column not in [c["column_name"].lower() for c in schema]:
-                raise ValueError(f"Column {column} not found in {table}")
+        # table definitions are independent requests, fetch them concurrently
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            definitions = executor.map(bcdata.get_table_definition, primary_keys)
+            for table, definition in zip(primary_keys, definitions):
+                column = primary_keys[table]
+                if column not in [c["column_name"].lower() for c in definition["schema"]]:
+                    raise ValueError(f"Column {column} not found in {table}")
         log.info(
             "Validation successful - columns listed in primary_keys.json are present in listed tables"
         )
@@ -1,25 +1,74 @@
+import json
+import logging
+import os
+import tempfile
+import time
+
 import requests
 
 from .bc2pg import bc2pg as bc2pg
 from .bcdc import get_table_definition as get_table_definition
 from .bcdc import get_table_name as get_table_name
+from .utils import get_cache_path, get_session
 from .wcs import get_dem as get_dem
 from .wfs import get_count as get_count
 from .wfs import get_data as get_data
+from .wfs import get_features as get_features
 from .wfs import get_sortkey as get_sortkey
 from .wfs import list_tables as list_tables
 from .wfs import validate_name as validate_name
 
+log = logging.getLogger(__name__)
+
 PRIMARY_KEY_DB_URL = "https://raw.githubusercontent.com/smnorris/bcdata/main/data/primary_keys.json"
 
 # BCDC does not indicate which column in the schema is the primary key.
 # In this absence, bcdata maintains its own dictionary of {table: primary_key},
-# served via github. Retrieve the dict with this function"""
-response = requests.get(PRIMARY_KEY_DB_URL)
-if response.status_code == 200:
-    primary_keys = response.json()
-else:
-    raise Exception(f"Failed to download primary key database at {PRIMARY_KEY_DB_URL}")
-    primary_keys = {}
+# served via github. The dict is cached locally and re-downloaded when more than a
+# day old (rather than on every import, eg each shell completion of a table name)
+PRIMARY_KEY_CACHE_SECONDS = 86400
+
+
+def load_primary_keys():
+    """
+    Return the {table: primary_key} dict, refreshing the cached copy if stale or invalid.
+    If the refresh fails, fall back to the (stale) cached copy.
+    """
+    primary_keys_file = os.path.join(get_cache_path(), "primary_keys.json")
+    primary_keys = None
+    if os.path.exists(primary_keys_file):
+        try:
+            with open(primary_keys_file, "r") as f:
+                primary_keys = json.load(f)
+        except json.JSONDecodeError:
+            log.warning(f"Ignoring invalid cache file {primary_keys_file}")
+    if (
+        primary_keys is None
+        or time.time() - os.path.getmtime(primary_keys_file) > PRIMARY_KEY_CACHE_SECONDS
+    ):
+        try:
+            response = get_session().get(PRIMARY_KEY_DB_URL)
+            response.raise_for_status()
+            primary_keys = response.json()
+        except requests.RequestException as e:
+            if primary_keys is None:
+                raise RuntimeError(
+                    f"Failed to download primary key database at {PRIMARY_KEY_DB_URL}"
+                ) from e
+            log.warning(f"Failed to refresh primary key database ({e}), using cached copy")
+        else:
+            # write to a temp file and move into place, so readers never see a partial file
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(primary_keys_file), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(response.content)
+                os.replace(tmp_file, primary_keys_file)
+            except BaseException:
+                os.remove(tmp_file)
+                raise
+    return primary_keys
+
 
 __version__ = "0.15.0"
+
+primary_keys = load_primary_keys()
@@ -1,16 +1,15 @@
+import glob
+import hashlib
+import itertools
 import logging
+import os
 
 import numpy
-from shapely.geometry.linestring import LineString
-from shapely.geometry.multilinestring import MultiLineString
-from shapely.geometry.multipoint import MultiPoint
-from shapely.geometry.multipolygon import MultiPolygon
-from shapely.geometry.point import Point
-from shapely.geometry.polygon import Polygon
+import shapely
 
 import bcdata
-from bcdata.database import Database
-from bcdata.wfs import BCWFS
+from bcdata.utils import get_cache_path
+from bcdata.wfs import MAX_WORKERS, get_wfs, promote_gdf_to_multi
 
 log = logging.getLogger(__name__)
 
@@ -28,6 +27,46 @@ SUPPORTED_TYPES = [
 ]
 
 
+def get_geometry_type(df):
+    """Return type of first non-null geometry in dataframe (with Z suffix if 3D), or None"""
+    if len(df) == 0:
+        return None
+    geoms = df.geometry.values.to_numpy()
+    type_ids = shapely.get_type_id(geoms)
+    if not numpy.any(type_ids >= 0):
+        return None
+    i = numpy.argmax(type_ids >= 0)
+    geometry_type = shapely.GeometryType(type_ids[i]).name
+    # geometry type ids do not include Z
+    if shapely.has_z(geoms[i]):
+        geometry_type = geometry_type + "Z"
+    return geometry_type
+
+
+def get_progress_file(db_url, schema_name, table_name, urls):
+    """
+    Return path to the file tracking pages written by a load, keyed on the target
+    database and the requests made (so only an identical load can be resumed)
+    """
+    key = hashlib.sha1("\n".join([str(db_url)] + urls).encode("utf-8")).hexdigest()
+    return os.path.join(get_cache_path(), f"{schema_name}.{table_name}.{key}.progress")
+
+
+def clear_progress(schema_name, table_name):
+    """Remove progress files of any previous loads of the table"""
+    prefix = os.path.join(get_cache_path(), f"{schema_name}.{table_name}.")
+    for progress_file in glob.glob(glob.escape(prefix) + "*.progress"):
+        os.remove(progress_file)
+
+
+def record_progress(progress_file, url):
+    """Note that the page at url has been written to the db"""
+    with open(progress_file, "a") as f:
+        f.write(url + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
 def bc2pg(  # noqa: C901
     dataset,
     db_url,
@@ -44,11 +83,20 @@ def bc2pg(  # noqa: C901
     schema_only=False,
     append=False,
     refresh=False,
+    max_workers=MAX_WORKERS,
+    resume=False,
+    pagesize=None,
 ):
     """Request table definition from bcdc and replicate in postgres"""
+    # import database module (sqlalchemy/geoalchemy2) only when loading to postgres
+    from bcdata.database import Database, psql_insert_copy
+
     if schema_only and append:
         raise ValueError("Options schema_only and append are not compatible")
 
+    if max_workers < 1:
+        raise ValueError(f"max_workers must be 1 or greater, got {max_workers}")
+
     dataset = bcdata.validate_name(dataset)
     schema_name, table_name = dataset.lower().split(".")
     if schema:
@@ -70,23 +118,47 @@ def bc2pg(  # noqa: C901
     db = Database(db_url)
 
     # create wfs service interface instance
-    WFS = BCWFS()
+    WFS = get_wfs()
 
     # define requests
     urls = WFS.define_requests(
-        dataset, query=query, bounds=bounds, bounds_crs=bounds_crs, count=count, sortby=sortby
+        dataset,
+        query=query,
+        bounds=bounds,
+        bounds_crs=bounds_crs,
+        count=count,
+        sortby=sortby,
+        pagesize=pagesize,
     )
 
     df = None  # just for tracking if first download is done by geometry type check
 
-    # if appending, get column names from db, make sure table exists
-    if append:
-        if schema_name + "." + table_name not in db.tables:
+    # pages written to the db are tracked in a file in the cache folder,
+    # if resuming an interrupted load, skip the pages already written
+    progress_file = get_progress_file(db.url, schema_name, table_name, urls)
+    completed = set()
+    if resume:
+        if os.path.exists(progress_file):
+            with open(progress_file, "r") as f:
+                completed = set(f.read().splitlines()).intersection(urls)
+        if completed:
+            log.info(f"Resuming load, {len(completed)} of {len(urls)} pages previously written")
+        else:
+            log.warning(
+                f"No progress found for this load of {schema_name}.{table_name} "
+                "(database or request parameters may differ), restarting load"
+            )
+    resuming = len(completed) > 0
+    urls = [url for url in urls if url not in completed]
+
+    # if appending (or resuming), get column names from db, make sure table exists
+    if append or resuming:
+        if not db.table_exists(schema_name, table_name):
             raise ValueError(f"{schema_name}.{table_name} does not exist")
         column_names = db.get_columns(schema_name, table_name)
 
     # if not appending, define and create table
-    if not append:
+    if not append and not resuming:
         # get info about the table from catalogue
         table_definition = bcdata.get_table_definition(dataset)
 
@@ -96,32 +168,21 @@ def bc2pg(  # noqa: C901
         # if geometry type is not provided, determine type by making the first request
         if not geometry_type:
             df = WFS.request_features(url=urls[0], as_gdf=True, lowercase=True)
-            geometry_type = df.geom_type.unique()[0]  # keep only the first type
-            if numpy.any(df.has_z.unique()[0]):  # geopandas does not include Z in geom_type string
-                geometry_type = geometry_type + "Z"
+            geometry_type = get_geometry_type(df)
 
         # if geometry type is still not populated try the last request
         # (in case all entrys with geom are near the bottom)
         if not geometry_type:
             if not urls[-1] == urls[0]:
-                df_temp = WFS.request_features(
-                    url=urls[-1],
-                    as_gdf=True,
-                    lowercase=True,
-                    silent=True,
-                )
-                geometry_type = df_temp.geom_type.unique()[0]  # keep only the first type
-                if numpy.any(
-                    df_temp.has_z.unique()[0]
-                ):  # geopandas does not include Z in geom_type string
-                    geometry_type = geometry_type + "Z"
+                df_temp = WFS.request_features(url=urls[-1], as_gdf=True, lowercase=True)
+                geometry_type = get_geometry_type(df_temp)
                 # drop the last request dataframe to free up memory
                 del df_temp
 
         # ensure geom type is valid
         geometry_type = geometry_type.upper()
         if geometry_type not in SUPPORTED_TYPES:
-            raise ValueError("Geometry type {geometry_type} is not supported")
+            raise ValueError(f"Geometry type {geometry_type} is not supported")
 
         # if primary key is not supplied, use default (if present in list)
         if not primary_key and dataset.lower() in bcdata.primary_keys:
@@ -132,7 +193,7 @@ def bc2pg(  # noqa: C901
             c["column_name"].upper() for c in table_definition["schema"]
         ]:
             raise ValueError(
-                "Column {primary_key} specified as primary_key does not exist in source"
+                f"Column {primary_key} specified as primary_key does not exist in source"
             )
 
         # build the table definition and create table
@@ -153,17 +214,31 @@ def bc2pg(  # noqa: C901
 
     # load the data
     if not schema_only:
-        # loop through the requests
-        for n, url in enumerate(urls):
-            # if first url not downloaded above when checking geom type, do now
-            if df is None:
-                df = WFS.request_features(url=url, as_gdf=True, lowercase=True)
-            # tidy the resulting dataframe
-            df = df.rename_geometry("geom")
+        # download pages concurrently, loading each to the db as it arrives
+        # (do not re-request the first url if downloaded above when checking geom type)
+        if df is None:
+            pages = WFS.request_features_concurrent(
+                urls, max_workers=max_workers, as_gdf=True, lowercase=True
+            )
+        else:
+            pages = itertools.chain(
+                [df],
+                WFS.request_features_concurrent(
+                    urls[1:], max_workers=max_workers, as_gdf=True, lowercase=True
+                ),
+            )
+        # discard progress of any previous loads of the table when not resuming
+        # (including those keyed on a different database or request)
+        if not resuming:
+            clear_progress(schema_name, table_name)
+        for url, df in zip(urls, pages):
+            # tidy the resulting dataframe (in place, avoiding copies of the page)
+            df.rename_geometry("geom", inplace=True)
             # lowercasify
             df.columns = df.columns.str.lower()
             # retain only columns matched in table definition
-            df = df[column_names]
+            # (column order does not matter, columns are named in the COPY statement)
+            df.drop(columns=[c for c in df.columns if c not in column_names], inplace=True)
             # extract features with no geometry
             df_nulls = df[df["geom"].isna()]
             # keep this df for loading with pandas
@@ -171,35 +246,40 @@ def bc2pg(  # noqa: C901
             # remove rows with null geometry from geodataframe
             df = df[df["geom"].notna()]
             # promote to multipart
-            if promote_to_multi:
-                df["geom"] = [
-                    MultiPoint([feature]) if isinstance(feature, Point) else feature
-                    for feature in df["geom"]
-                ]
-                df["geom"] = [
-                    MultiLineString([feature]) if isinstance(feature, LineString) else feature
-                    for feature in df["geom"]
-                ]
-                df["geom"] = [
-                    MultiPolygon([feature]) if isinstance(feature, Polygon) else feature
-                    for feature in df["geom"]
-                ]
+            if promote_to_multi and len(df) > 0:
+                df = promote_gdf_to_multi(df)
 
             # run the load in two parts, one with geoms, one with no geoms
+            # (both are written with COPY, in a single transaction - geopandas converts
+            # the geometries to hex EWKB in one vectorized shapely call, so no geometry
+            # parsing happens in the database)
             log.info(f"Writing {dataset} to database as {schema_name}.{table_name}")
-            df.to_postgis(table_name, db.engine, if_exists="append", schema=schema_name)
-            df_nulls.to_sql(
-                table_name,
-                db.engine,
-                if_exists="append",
-                schema=schema_name,
-                index=False,
-            )
+            with db.engine.begin() as conn:
+                if len(df) > 0:
+                    df.to_postgis(table_name, conn, if_exists="append", schema=schema_name)
+                if len(df_nulls) > 0:
+                    df_nulls.to_sql(
+                        table_name,
+                        conn,
+                        if_exists="append",
+                        schema=schema_name,
+                        index=False,
+                        method=psql_insert_copy,
+                    )
+            record_progress(progress_file, url)
             df = None
+        # load is complete, progress no longer required
+        if os.path.exists(progress_file):
+            os.remove(progress_file)
+
+    # index new tables once loaded, building the index in one pass is much faster than
+    # maintaining it for each page (refreshes load to a temp table, no index required)
+    if not append and not refresh:
+        db.create_spatial_index(schema_name, table_name)
 
-        # once load complete, note date/time of load completion in bcdata.log
-        # do not log refreshes here, they called by cli once loaded to target table
-        if timestamp and not refresh:
-            db.log(schema_name, table_name)
+    # once load complete, note date/time of load completion in bcdata.log
+    # do not log refreshes here, they called by cli once loaded to target table
+    if timestamp and not schema_only and not refresh:
+        db.log(schema_name, table_name)
 
     return schema_name + "." + table_name
@@ -1,10 +1,16 @@
+import hashlib
+import json
 import logging
+import os
+import tempfile
+from pathlib import Path
 from urllib.parse import urlparse
 
 import requests
 import stamina
 
 import bcdata
+from bcdata.utils import get_cache_path, get_session
 
 log = logging.getLogger(__name__)
 
@@ -15,9 +21,67 @@ class ServiceException(Exception):
     pass
 
 
+def _cache_file(url, params):
+    """Return path to the cached copy of an API response"""
+    request_url = requests.Request("GET", url, params=params).prepare().url
+    key = hashlib.sha1(request_url.encode("utf-8")).hexdigest()
+    return os.path.join(get_cache_path(), "bcdc", key + ".json")
+
+
+def _conditional_get(url, params):
+    """
+    Make a GET request, sending the ETag / Last-Modified validators of any
+    previously cached response so the API can reply with 304 Not Modified.
+    Returns the response and the json body (None if request was not successful)
+    """
+    cache_file = _cache_file(url, params)
+    cached = None
+    headers = {}
+    if os.path.exists(cache_file):
+        # an unreadable cache file is treated as a cache miss (and replaced below)
+        try:
+            with open(cache_file, "r") as f:
+                cached = json.load(f)
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            log.warning(f"Ignoring invalid cache file {cache_file}")
+            cached = None
+            headers = {}
+    r = get_session().get(url, params=params, headers=headers)
+    # cached copy is still valid, use it
+    if r.status_code == 304 and cached:
+        return r, cached["body"]
+    if r.status_code != 200:
+        return r, None
+    body = r.json()
+    # cache the response only if the server provides a validator
+    if "ETag" in r.headers or "Last-Modified" in r.headers:
+        Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+        # write to a temp file and move into place, so readers never see a partial file
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(
+                    {
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                        "body": body,
+                    },
+                    f,
+                )
+            os.replace(tmp_file, cache_file)
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+    return r, body
+
+
 @stamina.retry(on=requests.HTTPError, timeout=60)
 def _package_show(package):
-    r = requests.get(BCDC_API_URL + "package_show", params={"id": package})
+    r, body = _conditional_get(BCDC_API_URL + "package_show", {"id": package})
     if r.status_code in [400, 404]:
         log.error(f"HTTP error {r.status_code}")
         log.error(f"Response headers: {r.headers}")
@@ -30,29 +94,32 @@ def _package_show(package):
         r.raise_for_status()
     else:
         log.debug(r.text)
-    return r
+    if body is None:
+        raise ServiceException(f"Unexpected response from DataBC API: HTTP {r.status_code}")
+    return body
 
 
 @stamina.retry(on=requests.HTTPError, timeout=60)
 def _table_definition(table_name):
-    r = requests.get(
+    r, body = _conditional_get(
         BCDC_API_URL + "package_search",
-        params={"q": "res_extras_object_name:" + table_name},
+        {"q": "res_extras_object_name:" + table_name},
     )
-    if r.status_code != 200:
+    if r.status_code not in [200, 304]:
         log.warning(r.headers)
     if r.status_code in [400, 401, 404]:
         raise ServiceException(r.text)  # presumed request error
     if r.status_code in [500, 502, 503, 504]:  # presumed serivce error, retry
         r.raise_for_status()
-    return r
+    if body is None:
+        raise ServiceException(f"Unexpected response from DataBC API: HTTP {r.status_code}")
+    return body
 
 
 def get_table_name(package):
     """Query DataBC API to find WFS table/layer name for given package"""
     package = package.lower()  # package names are lowercase
-    r = _package_show(package)
-    result = r.json()["result"]
+    result = _package_show(package)["result"]
     # Because the object_name in the result json is not a 100% reliable key
     # for WFS requests, parse URL in WMS resource(s).
     # Also, some packages may have >1 WFS layer - if this is the case, bail
@@ -78,8 +145,8 @@ def get_table_definition(table_name):
     if table_name not in bcdata.list_tables():
         raise ValueError(f"Only tables available via WFS are supported, {table_name} not found")
 
-    # search the api for the provided table
-    r = _table_definition(table_name)
+    # search the api for the provided table, parsing the response only once
+    search_result = _table_definition(table_name)["result"]
 
     # start with an empty table definition dict
     table_definition = {
@@ -89,35 +156,33 @@ def get_table_definition(table_name):
         "primary_key": None,
     }
 
+    # object names in the catalogue that match the table name
+    object_names = {table_name}
+    # hack to handle object name / table name mismatch for NR Districts
+    if table_name == "WHSE_ADMIN_BOUNDARIES.ADM_NR_DISTRICTS_SPG":
+        object_names.add("WHSE_ADMIN_BOUNDARIES.ADM_NR_DISTRICTS_SP")
+
     # if there are no matching results, let the user know
-    if r.json()["result"]["count"] == 0:
+    if search_result["count"] == 0:
         log.warning(f"BC Data Catalogue API search provides no results for: {table_name}")
     else:
         # iterate through results of search (packages)
-        for result in r.json()["result"]["results"]:
+        for result in search_result["results"]:
             # description is at top level, same for all resources
             table_definition["description"] = result["notes"]
             # iterate through resources associated with each package
             for resource in result["resources"]:
                 # only examine geographic resources with object name key
-                if "object_name" in resource.keys() and resource["bcdc_type"] == "geographic":
+                if "object_name" in resource and resource["bcdc_type"] == "geographic":
                     # confirm that object name matches table name and schema is present
                     if (
-                        (
-                            table_name == resource["object_name"]
-                            # hack to handle object name / table name mismatch for NR Districts
-                            or (
-                                table_name == "WHSE_ADMIN_BOUNDARIES.ADM_NR_DISTRICTS_SPG"
-                                and resource["object_name"]
-                                == "WHSE_ADMIN_BOUNDARIES.ADM_NR_DISTRICTS_SP"
-                            )
-                        )
-                        and "details" in resource.keys()
+                        resource["object_name"] in object_names
+                        and "details" in resource
                         and resource["details"] != []
                     ):
                         table_definition["schema"] = resource["details"]
                         # look for comments only if details/schema was found
-                        if "object_table_comments" in resource.keys():
+                        if "object_table_comments" in resource:
                             table_definition["comments"] = resource["object_table_comments"]
 
     if not table_definition["schema"]:
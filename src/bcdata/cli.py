@@ -1,14 +1,14 @@
 import json
 import logging
 import os
-import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import click
+import orjson
 from cligj import compact_opt, indent_opt, quiet_opt, verbose_opt
 
 import bcdata
-from bcdata.database import Database
 
 LOG_FORMAT = "%(asctime)s:%(levelname)s:%(name)s: %(message)s"
 
@@ -42,7 +42,7 @@ def bounds_handler(ctx, param, value):
     if retval is None and value is not None:
         try:
             value = value.strip(", []")
-            retval = tuple(float(x) for x in re.split(r"[,\s]+", value))
+            retval = tuple(map(float, value.replace(",", " ").split()))
             assert len(retval) == 4
             return retval
         except Exception:
@@ -62,7 +62,10 @@ bounds_opt = click.option(
     "--bounds",
     default=None,
     callback=bounds_handler,
-    help='Bounds: "left bottom right top" or "[left, bottom, right, top]". Coordinates are BC Albers (default) or --bounds_crs',
+    help=(
+        'Bounds: "left bottom right top" or "[left, bottom, right, top]". '
+        "Coordinates are BC Albers (default) or --bounds_crs"
+    ),
 )
 
 bounds_opt_dem = click.option(
@@ -70,7 +73,10 @@ bounds_opt_dem = click.option(
     required=True,
     default=None,
     callback=bounds_handler,
-    help='Bounds: "left bottom right top" or "[left, bottom, right, top]". Coordinates are BC Albers (default) or --bounds_crs',
+    help=(
+        'Bounds: "left bottom right top" or "[left, bottom, right, top]". '
+        "Coordinates are BC Albers (default) or --bounds_crs"
+    ),
 )
 
 
@@ -78,6 +84,25 @@ lowercase_opt = click.option(
     "--lowercase", "-l", is_flag=True, help="Write column/properties names as lowercase"
 )
 
+workers_opt = click.option(
+    "--workers",
+    "-w",
+    type=click.IntRange(min=1),
+    default=bcdata.wfs.MAX_WORKERS,
+    show_default=True,
+    help="Maximum number of concurrent WFS requests",
+)
+
+pagesize_opt = click.option(
+    "--pagesize",
+    "-p",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Max number of features to request per page (default and upper limit is the server default)"
+    ),
+)
+
 
 @click.group()
 @click.version_option(version=bcdata.__version__, message="%(version)s")
@@ -128,13 +153,27 @@ def info(dataset, indent, meta_member, verbose, quiet):
     verbosity = verbose - quiet
     configure_logging(verbosity)
     dataset = bcdata.validate_name(dataset)
-    info = bcdata.get_table_definition(dataset)
-    info["name"] = dataset
-    info["count"] = bcdata.get_count(dataset)
-    if meta_member:
-        click.echo(info[meta_member])
+    # only make the requests required for the item specified
+    if meta_member == "name":
+        click.echo(dataset)
+    elif meta_member == "count":
+        click.echo(bcdata.get_count(dataset))
+    elif meta_member:
+        click.echo(bcdata.get_table_definition(dataset)[meta_member])
     else:
-        click.echo(json.dumps(info, indent=indent))
+        # the catalogue and WFS requests are independent, make them concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            table_definition = executor.submit(bcdata.get_table_definition, dataset)
+            count = executor.submit(bcdata.get_count, dataset)
+            info = table_definition.result()
+            info["name"] = dataset
+            info["count"] = count.result()
+        # orjson only supports indenting by 2 spaces
+        if indent and indent != 2:
+            click.echo(json.dumps(info, indent=indent))
+        else:
+            option = orjson.OPT_INDENT_2 if indent else 0
+            click.get_binary_stream("stdout").write(orjson.dumps(info, option=option) + b"\n")
 
 
 @cli.command()
@@ -155,7 +194,7 @@ def info(dataset, indent, meta_member, verbose, quiet):
 @click.option(
     "--interpolation",
     "-i",
-    type=click.Choice(["nearest", "bilinear", "bicubic"], case_sensitive=False),
+    type=click.Choice(bcdata.wcs.INTERPOLATIONS, case_sensitive=False),
 )
 @verbose_opt
 @quiet_opt
@@ -211,12 +250,32 @@ def dem(
     is_flag=True,
     default=False,
 )
+@click.option(
+    "--out_file",
+    "-o",
+    default="-",
+    help="Output file (default stdout)",
+)
+@workers_opt
+@pagesize_opt
 @verbose_opt
 @quiet_opt
 def dump(
-    dataset, query, count, bounds, bounds_crs, sortby, lowercase, promote_to_multi, verbose, quiet
+    dataset,
+    query,
+    count,
+    bounds,
+    bounds_crs,
+    sortby,
+    lowercase,
+    promote_to_multi,
+    out_file,
+    workers,
+    pagesize,
+    verbose,
+    quiet,
 ):
-    """Write DataBC features to stdout as GeoJSON feature collection.
+    """Write DataBC features to stdout (or file) as GeoJSON feature collection.
 
     \b
       $ bcdata dump bc-airports
@@ -231,19 +290,28 @@ def dump(
     verbosity = verbose - quiet
     configure_logging(verbosity)
     table = bcdata.validate_name(dataset)
-    data = bcdata.get_data(
-        table,
-        query=query,
-        count=count,
-        bounds=bounds,
-        bounds_crs=bounds_crs,
-        sortby=sortby,
-        lowercase=lowercase,
-        promote_to_multi=promote_to_multi,
-        as_gdf=False,
-    )
-    sink = click.get_text_stream("stdout")
-    sink.write(json.dumps(data))
+    # write the collection one feature at a time rather than holding it all in memory
+    with click.open_file(out_file, "wb") as sink:
+        sink.write(b'{"type":"FeatureCollection","features":[')
+        for i, feat in enumerate(
+            bcdata.get_features(
+                table,
+                query=query,
+                count=count,
+                bounds=bounds,
+                bounds_crs=bounds_crs,
+                sortby=sortby,
+                lowercase=lowercase,
+                promote_to_multi=promote_to_multi,
+                max_workers=workers,
+                pagesize=pagesize,
+            )
+        ):
+            if i > 0:
+                sink.write(b",")
+            sink.write(orjson.dumps(feat))
+        sink.write(b'],"crs":' + orjson.dumps(bcdata.wfs.CRS) + b"}")
+        sink.flush()
 
 
 @cli.command()
@@ -277,6 +345,20 @@ def dump(
     is_flag=True,
     default=False,
 )
+@click.option(
+    "--sort-keys",
+    is_flag=True,
+    default=False,
+    help="Sort the keys of each feature",
+)
+@click.option(
+    "--rs",
+    is_flag=True,
+    default=False,
+    help="Write a RS control character before each feature (RFC 7464 GeoJSON text sequence)",
+)
+@workers_opt
+@pagesize_opt
 @verbose_opt
 @quiet_opt
 def cat(
@@ -290,37 +372,59 @@ def cat(
     sortby,
     lowercase,
     promote_to_multi,
+    sort_keys,
+    rs,
+    workers,
+    pagesize,
     verbose,
     quiet,
 ):
-    """Write DataBC features to stdout as GeoJSON feature objects."""
+    """Write DataBC features to stdout as GeoJSON feature objects.
+
+    Feature keys are written in the order received unless --sort-keys is specified.
+    """
     # Note that cat does not concatenate!
     verbosity = verbose - quiet
     configure_logging(verbosity)
-    dump_kwds = {"sort_keys": True}
     if sortby:
         sortby = sortby.upper()
-    if indent:
-        dump_kwds["indent"] = indent
-    if compact:
-        dump_kwds["separators"] = (",", ":")
+    # write features with orjson (compact output, or indented by 2 with standard separators),
+    # falling back to the standard library json module for other indents or for compact
+    # separators with an indent (neither supported by orjson)
+    if indent and (indent != 2 or compact):
+        dump_kwds = {"sort_keys": sort_keys, "indent": indent}
+        if compact:
+            dump_kwds["separators"] = (",", ":")
+
+        def dumps(feat):
+            return json.dumps(feat, **dump_kwds).encode()
+    else:
+        option = 0
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+
+        def dumps(feat):
+            return orjson.dumps(feat, option=option)
+
     table = bcdata.validate_name(dataset)
-    WFS = bcdata.wfs.BCWFS()
-    for url in WFS.define_requests(
+    sink = click.get_binary_stream("stdout")
+    prefix = b"\x1e" if rs else b""
+    for feat in bcdata.get_features(
         table,
         query=query,
         count=count,
         bounds=bounds,
         bounds_crs=bounds_crs,
+        sortby=sortby,
+        lowercase=lowercase,
+        promote_to_multi=promote_to_multi,
+        max_workers=workers,
+        pagesize=pagesize,
     ):
-        featurecollection = WFS.request_features(
-            url=url,
-            as_gdf=False,
-            lowercase=lowercase,
-            promote_to_multi=promote_to_multi,
-        )
-        for feat in featurecollection["features"]:
-            click.echo(json.dumps(feat, **dump_kwds))
+        sink.write(prefix + dumps(feat) + b"\n")
+    sink.flush()
 
 
 @cli.command()
@@ -378,6 +482,16 @@ def cat(
     is_flag=True,
     help="Do not log download to bcdata.log",
 )
+@workers_opt
+@pagesize_opt
+@click.option(
+    "--resume",
+    is_flag=True,
+    help=(
+        "Resume an interrupted load, skipping pages already written "
+        "(source data and options must not have changed)"
+    ),
+)
 @verbose_opt
 @quiet_opt
 def bc2pg(
@@ -396,6 +510,9 @@ def bc2pg(
     schema_only,
     append,
     refresh,
+    workers,
+    pagesize,
+    resume,
     verbose,
     quiet,
 ):
@@ -404,6 +521,8 @@ def bc2pg(
     \b
      $ bcdata bc2pg whse_imagery_and_base_maps.gsr_airports_svw
     """
+    from bcdata.database import Database
+
     # for this command, default to INFO level logging
     verbosity = verbose - quiet
     log_level = max(10, 20 - 10 * verbosity)
@@ -425,8 +544,8 @@ def bc2pg(
         db = Database(db_url)
         schema = "bcdata"
         if not table:
-            table = bcdata.validate_name(dataset).lower().split(".")
-        if schema_target + "." + table not in db.tables:
+            table = bcdata.validate_name(dataset).lower().split(".")[1]
+        if not db.table_exists(schema_target, table):
             raise ValueError(f"Cannot refresh, {schema_target}.{table} not found in database")
     out_table = bcdata.bc2pg(
         dataset,
@@ -444,11 +563,13 @@ def bc2pg(
         schema_only=schema_only,
         append=append,
         refresh=refresh,
+        max_workers=workers,
+        pagesize=pagesize,
+        resume=resume,
     )
 
     # if refreshing, flush from temp bcdata schema to target schema
     if refresh:
-        db = Database(db_url)
         s, table = out_table.split(".")
         db.refresh(schema_target, table)
         out_table = schema_target + "." + table
@@ -1,24 +1,50 @@
+import csv
+import functools
+import io
 import logging
 import os
 
 from geoalchemy2 import Geometry
 from psycopg2 import errors, sql
+from psycopg2.extras import execute_batch
 from sqlalchemy import Column, MetaData, Table, create_engine
 from sqlalchemy.dialects.postgresql import DATE, NUMERIC, VARCHAR
+from sqlalchemy.schema import CreateSchema
 
 log = logging.getLogger(__name__)
 
+# redundant columns, not loaded to postgres
+EXCLUDED_COLUMNS = frozenset(["FEATURE_AREA_SQM", "FEATURE_LENGTH_M"])
+
+
+def psql_insert_copy(table, conn, keys, data_iter):
+    """pandas.DataFrame.to_sql insertion method, loading rows with COPY rather than INSERT"""
+    buf = io.StringIO()
+    csv.writer(buf).writerows(data_iter)
+    buf.seek(0)
+    with conn.connection.cursor() as curs:
+        dbq = sql.SQL("COPY {schema}.{table} ({columns}) FROM STDIN WITH CSV").format(
+            schema=sql.Identifier(table.schema),
+            table=sql.Identifier(table.name),
+            columns=sql.SQL(",").join([sql.Identifier(k) for k in keys]),
+        )
+        curs.copy_expert(dbq.as_string(curs), buf)
+
+
+@functools.cache
+def get_engine(url):
+    """Return an engine (and its connection pool) for url, shared by Database instances"""
+    return create_engine(url, connect_args={"application_name": "bcdata"})
+
 
 class Database(object):
     """Wrapper around sqlalchemy"""
 
     def __init__(self, url=os.environ.get("DATABASE_URL")):
         self.url = url
-        self.engine = create_engine(url)
+        self.engine = get_engine(url)
         # make sure postgis is available
-        try:
-            self.query("SELECT postgis_full_version()")
-        except errors.UndefinedFunction:
+        if not self.query("SELECT 1 FROM pg_extension WHERE extname = 'postgis'"):
             log.error(
                 "Cannot find PostGIS, has extension been installed on database %s ?",
                 url,
@@ -43,10 +69,21 @@ class Database(object):
     @property
     def tables(self):
         """List all non-system tables in the db"""
-        tables = []
-        for schema in self.schemas:
-            tables = tables + [schema + "." + t for t in self.tables_in_schema(schema)]
-        return tables
+        sql = """SELECT table_schema || '.' || table_name
+                 FROM information_schema.tables
+                 WHERE left(table_schema, 3) <> 'pg_'
+                 ORDER BY table_schema"""
+        return [t[0] for t in self.query(sql)]
+
+    def table_exists(self, schema, table):
+        """Check if table exists in db"""
+        sql = "SELECT to_regclass(quote_ident(%s) || '.' || quote_ident(%s))"
+        return self.query(sql, (schema, table))[0][0] is not None
+
+    def schema_exists(self, schema):
+        """Check if schema exists in db"""
+        sql = "SELECT EXISTS (SELECT 1 FROM pg_namespace WHERE nspname = %s)"
+        return self.query(sql, (schema,))[0][0]
 
     def tables_in_schema(self, schema):
         """Get a listing of all tables in given schema"""
@@ -58,34 +95,44 @@ class Database(object):
     def query(self, sql, params=None):
         """Execute sql and return all results"""
         conn = self.engine.raw_connection()
-        with conn.cursor() as curs:
-            curs.execute(sql, params)
-            result = curs.fetchall()
+        try:
+            with conn.cursor() as curs:
+                curs.execute(sql, params)
+                result = curs.fetchall()
+        finally:
+            # return the connection to the engine's pool
+            conn.close()
         return result
 
     def execute(self, sql, params=None):
         """Execute sql and return only whether the query was successful"""
         conn = self.engine.raw_connection()
-        with conn.cursor() as curs:
-            result = curs.execute(sql, params)
-            conn.commit()
+        try:
+            with conn.cursor() as curs:
+                result = curs.execute(sql, params)
+                conn.commit()
+        finally:
+            conn.close()
         return result
 
     def execute_many(self, sql, params):
-        """Execute many sql"""
+        """Execute sql for each set of params, batching statements to limit round trips"""
         conn = self.engine.raw_connection()
-        with conn.cursor() as curs:
-            curs.executemany(sql, params)
-            conn.commit()
+        try:
+            with conn.cursor() as curs:
+                execute_batch(curs, sql, params, page_size=1000)
+                conn.commit()
+        finally:
+            conn.close()
 
     def create_schema(self, schema):
-        if schema not in self.schemas:
+        if not self.schema_exists(schema):
             log.info(f"Schema {schema} does not exist, creating it")
             dbq = sql.SQL("CREATE SCHEMA {schema}").format(schema=sql.Identifier(schema))
             self.execute(dbq)
 
     def drop_table(self, schema, table):
-        if schema + "." + table in self.tables:
+        if self.table_exists(schema, table):
             log.info(f"Dropping table {schema}.{table}")
             dbq = sql.SQL("DROP TABLE {schema}.{table}").format(
                 schema=sql.Identifier(schema),
@@ -95,28 +142,25 @@ class Database(object):
 
     def refresh(self, schema, table):
         # move data from temp table to target table
-        if schema + "." + table in self.tables:
+        if self.table_exists(schema, table):
             log.warning(f"Truncating table {schema}.{table} and refreshing from bcdata.{table}")
-            dbq = sql.SQL("TRUNCATE {schema}.{table}").format(
-                schema=sql.Identifier(schema),
-                table=sql.Identifier(table),
-            )
-            self.execute(dbq)
             columns = list(
                 set(self.get_columns("bcdata", table)).intersection(self.get_columns(schema, table))
             )
             identifiers = [sql.Identifier(c) for c in columns]
+            # truncate, copy and drop the temp table in a single transaction
             dbq = sql.SQL(
-                """INSERT INTO {schema}.{table}
+                """TRUNCATE {schema}.{table};
+                INSERT INTO {schema}.{table}
                 ({columns})
-                SELECT {columns} FROM bcdata.{table}"""
+                SELECT {columns} FROM bcdata.{table};
+                DROP TABLE bcdata.{table};"""
             ).format(
                 schema=sql.Identifier(schema),
                 table=sql.Identifier(table),
                 columns=sql.SQL(",").join(identifiers),
             )
             self.execute(dbq)
-            self.drop_table("bcdata", table)
         else:
             raise ValueError(f"Target table {schema}.{table} does not exist in database")
 
@@ -131,50 +175,33 @@ class Database(object):
         primary_key=None,
     ):
         """build sqlalchemy table definition from bcdc provided json definitions"""
-        # remove columns of unsupported types, redundant columns
-        table_details = [c for c in table_details if c["data_type"] in self.supported_types.keys()]
-        table_details = [
-            c
-            for c in table_details
-            if c["column_name"] not in ["FEATURE_AREA_SQM", "FEATURE_LENGTH_M"]
-        ]
-
-        # translate the oracle types to sqlalchemy provided postgres types
+        # translate the oracle types to sqlalchemy provided postgres types, in a single pass
+        # (dropping columns of unsupported types and redundant columns)
         columns = []
-        for i in range(len(table_details)):
-            column_name = table_details[i]["column_name"].lower()
-            column_type = self.supported_types[table_details[i]["data_type"]]
-            # append precision if varchar or numeric
-            if table_details[i]["data_type"] == "VARCHAR2":
-                column_type = column_type(int(table_details[i]["data_precision"]))
-            # check that comments are present
-            if "column_comments" in table_details[i].keys():
-                column_comments = table_details[i]["column_comments"]
-            else:
-                column_comments = None
-            if column_name == primary_key:
-                columns.append(
-                    Column(
-                        column_name,
-                        column_type,
-                        primary_key=True,
-                        comment=column_comments,
-                    )
-                )
-            else:
-                columns.append(
-                    Column(
-                        column_name,
-                        column_type,
-                        comment=column_comments,
-                    )
+        for column in table_details:
+            data_type = column["data_type"]
+            if data_type not in self.supported_types or column["column_name"] in EXCLUDED_COLUMNS:
+                continue
+            column_name = column["column_name"].lower()
+            column_type = self.supported_types[data_type]
+            # append precision if varchar
+            if data_type == "VARCHAR2":
+                column_type = column_type(int(column["data_precision"]))
+            columns.append(
+                Column(
+                    column_name,
+                    column_type,
+                    primary_key=column_name == primary_key,
+                    comment=column.get("column_comments"),
                 )
+            )
 
         # make everything multipart
         # (some datasets have mixed singlepart/multipart geometries)
         if promote_to_multi and geom_type[:5] != "MULTI":
             geom_type = "MULTI" + geom_type
-        columns.append(Column("geom", Geometry(geom_type, srid=3005)))
+        # (the spatial index is created separately, once data is loaded)
+        columns.append(Column("geom", Geometry(geom_type, srid=3005, spatial_index=False)))
         metadata_obj = MetaData()
         table = Table(
             table_name,
@@ -184,25 +211,44 @@ class Database(object):
             schema=schema_name,
         )
 
-        if schema_name not in self.schemas:
-            self.create_schema(schema_name)
-
-        # drop existing table
-        if schema_name + "." + table_name in self.tables:
-            log.warning(f"Table {schema_name}.{table_name} exists, overwriting")
-            self.drop_table(schema_name, table_name)
-
-        # create the table
-        if schema_name + "." + table_name not in self.tables:
+        # create schema, drop existing table and create the table in a single transaction
+        exists = self.table_exists(schema_name, table_name)
+        with self.engine.begin() as conn:
+            conn.execute(CreateSchema(schema_name, if_not_exists=True))
+            if exists:
+                log.warning(f"Table {schema_name}.{table_name} exists, overwriting")
+                table.drop(conn)
             log.info(f"Creating table {schema_name}.{table_name}")
-            table.create(self.engine)
+            table.create(conn)
 
         return table
 
+    def create_spatial_index(self, schema, table, column="geom", maintenance_work_mem="1GB"):
+        """Create gist index on geometry column and update table statistics"""
+        log.info(f"Indexing {schema}.{table}")
+        # give the index build more memory than the server default, for this transaction only
+        dbq = sql.SQL(
+            """SET LOCAL maintenance_work_mem = {maintenance_work_mem};
+               CREATE INDEX {index} ON {schema}.{table} USING GIST ({column});
+               ANALYZE {schema}.{table};"""
+        ).format(
+            maintenance_work_mem=sql.Literal(maintenance_work_mem),
+            index=sql.Identifier(f"idx_{table}_{column}"),
+            schema=sql.Identifier(schema),
+            table=sql.Identifier(table),
+            column=sql.Identifier(column),
+        )
+        self.execute(dbq)
+
     def get_columns(self, schema, table):
-        metadata_obj = MetaData(schema=schema)
-        table = Table(table, metadata_obj, schema=schema, autoload_with=self.engine)
-        return list(table.columns.keys())
+        """List column names of table, in table order"""
+        sql = """SELECT attname
+                 FROM pg_attribute
+                 WHERE attrelid = to_regclass(quote_ident(%s) || '.' || quote_ident(%s))
+                 AND attnum > 0
+                 AND NOT attisdropped
+                 ORDER BY attnum"""
+        return [c[0] for c in self.query(sql, (schema, table))]
 
     def log(self, schema_name, table_name):
         log.info("Logging download date to bcdata.log")
@@ -0,0 +1,39 @@
+import functools
+import os
+from pathlib import Path
+
+import requests
+
+import bcdata
+
+
+@functools.cache
+def get_session():
+    """Return a requests session shared by all bcdata requests, re-using connections"""
+    session = requests.Session()
+    session.headers.update({"User-Agent": f"bcdata.py ({bcdata.__version__})"})
+    return session
+
+
+def get_cache_path():
+    """
+    Return path to the bcdata cache folder, creating it if it does not exist.
+    Cache is one of:
+      - $BCDATA_CACHE environment variable
+      - default (~/.bcdata)
+    """
+    if "BCDATA_CACHE" in os.environ:
+        cache_path = os.environ["BCDATA_CACHE"]
+    else:
+        cache_path = os.path.join(str(Path.home()), ".bcdata")
+    # if a file exists in the path provided AND the file name is .bcdata, delete it
+    p = Path(cache_path)
+    if p.is_file():
+        if cache_path[-7:] == ".bcdata":
+            p.unlink()
+        # if the file is named something else, prompt user to delete it
+        else:
+            raise RuntimeError(f"Cache file exists, delete before using bcdata: {cache_path}")
+    # create cache folder if it does not exist
+    p.mkdir(parents=True, exist_ok=True)
+    return cache_path
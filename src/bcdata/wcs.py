@@ -1,14 +1,21 @@
 import logging
 from math import trunc
 
-import rasterio
 import requests
 import stamina
 
+from bcdata.utils import get_session
+
 log = logging.getLogger(__name__)
 
 WCS_URL = "https://openmaps.gov.bc.ca/om/wcs"
 
+# resampling methods supported by the WCS
+INTERPOLATIONS = ("nearest", "bilinear", "bicubic")
+
+# size of chunks read from the (streamed) coverage response
+READ_DATA_CHUNK = 128 * 1024
+
 
 class ServiceException(Exception):
     pass
@@ -26,24 +33,22 @@ def align_bounds(bounds):
 
 @stamina.retry(on=requests.HTTPError, timeout=60)
 def make_request(payload):
-    r = requests.get(
-        WCS_URL,
-        params=payload,
-        headers={"User-Agent": "bcdata.py ({bcdata.__version__})"},
-    )
+    r = get_session().get(WCS_URL, params=payload, stream=True)
     log.debug(r.url)
     if r.status_code == 200:
         return r
-    elif r.status_code in [400, 401, 404]:
-        log.error(f"HTTP error {r.status_code}")
-        log.error(f"Response headers: {r.headers}")
-        log.error(f"Response text: {r.text}")
-        raise ServiceException(r.text)  # presumed request error
-    elif r.status_code in [500, 502, 503, 504]:  # presumed serivce error, retry
-        log.warning(f"HTTP error: {r.status_code}, retrying")
-        log.warning(f"Response headers: {r.headers}")
-        log.warning(f"Response text: {r.text}")
-        r.raise_for_status()
+    # close the (streamed) error response, releasing the connection
+    with r:
+        if r.status_code in [500, 502, 503, 504]:  # presumed serivce error, retry
+            log.warning(f"HTTP error: {r.status_code}, retrying")
+            log.warning(f"Response headers: {r.headers}")
+            log.warning(f"Response text: {r.text}")
+            r.raise_for_status()
+        else:
+            log.error(f"HTTP error {r.status_code}")
+            log.error(f"Response headers: {r.headers}")
+            log.error(f"Response text: {r.text}")
+            raise ServiceException(r.text)  # presumed request error
 
 
 def get_dem(
@@ -81,18 +86,16 @@ def get_dem(
     # resampling requested - resolution can't be the native 25m
     if interpolation and resolution == 25:
         raise ValueError(
-            "Requested coverage at native resolution, no resampling required, interpolation {} invalid"
+            f"Requested coverage at native resolution, no resampling required, interpolation {interpolation} invalid"
         )
 
     # make sure interpolation is valid
-    if interpolation:
-        valid_interpolations = ["nearest", "bilinear", "bicubic"]
-        if interpolation not in valid_interpolations:
-            raise ValueError(
-                "Interpolation {} invalid. Valid keys are: {}".format(
-                    interpolation, ",".join(valid_interpolations)
-                )
+    if interpolation and interpolation not in INTERPOLATIONS:
+        raise ValueError(
+            "Interpolation {} invalid. Valid keys are: {}".format(
+                interpolation, ",".join(INTERPOLATIONS)
             )
+        )
 
     # build request
     payload = {
@@ -112,19 +115,25 @@ def get_dem(
 
     # request data from WCS
     log.debug(payload)
-    r = make_request(payload)
-    if r.headers["Content-Type"] == "image/tiff":
-        with open(out_file, "wb") as file:
-            file.write(r.content)
-    elif r.headers["Content-Type"] == "application/vnd.ogc.se_xml;charset=UTF-8":
-        raise RuntimeError(
-            "WCS request {} failed with error {}".format(r.url, str(r.content.decode("utf-8")))
-        )
-    else:
-        raise RuntimeError(
-            "WCS request {} failed, content type {}".format(r.url, str(r.headers["Content-Type"]))
-        )
+    # (the response is closed on exit, including if writing fails)
+    with make_request(payload) as r:
+        if r.headers["Content-Type"] == "image/tiff":
+            # stream the response to file rather than holding it in memory
+            with open(out_file, "wb") as file:
+                file.writelines(r.iter_content(chunk_size=READ_DATA_CHUNK))
+        elif r.headers["Content-Type"] == "application/vnd.ogc.se_xml;charset=UTF-8":
+            raise RuntimeError(
+                "WCS request {} failed with error {}".format(r.url, str(r.content.decode("utf-8")))
+            )
+        else:
+            raise RuntimeError(
+                "WCS request {} failed, content type {}".format(
+                    r.url, str(r.headers["Content-Type"])
+                )
+            )
     if as_rasterio:
+        import rasterio
+
         return rasterio.open(out_file, "r")
     else:
         return out_file
@@ -1,49 +1,59 @@
+import functools
 import json
 import logging
-import math
 import os
 import sys
 import warnings
 import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from pathlib import Path
 from urllib.parse import urlencode
 
 import geopandas as gpd
+import numpy
+import orjson
 import pandas as pd
 import requests
+import shapely
 import stamina
 from owslib.feature import schema as wfs_schema
 from owslib.feature import wfs200
 from owslib.wfs import WebFeatureService
-from shapely.geometry.linestring import LineString
-from shapely.geometry.multilinestring import MultiLineString
-from shapely.geometry.multipoint import MultiPoint
-from shapely.geometry.multipolygon import MultiPolygon
-from shapely.geometry.point import Point
-from shapely.geometry.polygon import Polygon
+from requests.adapters import HTTPAdapter
 
 import bcdata
+from bcdata.utils import get_cache_path, get_session
 
 if not sys.warnoptions:
     warnings.simplefilter("ignore")
 
 log = logging.getLogger(__name__)
 
+# GeoJSON crs member for data requested from DataBC WFS (as written by geopandas)
+CRS = {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::3005"}}
+
+# warn when requesting all features of layers larger than this
+LARGE_REQUEST_COUNT = 100000
+
+# default maximum number of concurrent WFS requests when downloading multiple pages
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+
 
 def promote_gdf_to_multi(df):
     """Promote all features to multipart"""
-    df.geometry = [
-        MultiPoint([feature]) if isinstance(feature, Point) else feature for feature in df.geometry
-    ]
-    df.geometry = [
-        MultiLineString([feature]) if isinstance(feature, LineString) else feature
-        for feature in df.geometry
-    ]
-    df.geometry = [
-        MultiPolygon([feature]) if isinstance(feature, Polygon) else feature
-        for feature in df.geometry
-    ]
+    geoms = df.geometry.values.to_numpy().copy()
+    type_ids = shapely.get_type_id(geoms)
+    for type_id, to_multi in [
+        (shapely.GeometryType.POINT, shapely.multipoints),
+        (shapely.GeometryType.LINESTRING, shapely.multilinestrings),
+        (shapely.GeometryType.POLYGON, shapely.multipolygons),
+    ]:
+        mask = type_ids == type_id
+        if mask.any():
+            # build one multipart geometry per singlepart geometry
+            geoms[mask] = to_multi(geoms[mask], indices=numpy.arange(mask.sum()))
+    df.geometry = gpd.GeoSeries(geoms, index=df.index, crs=df.crs)
     return df
 
 
@@ -59,22 +69,7 @@ class BCWFS(object):
         self.ows_url = "http://openmaps.gov.bc.ca/geo/pub/ows?service=WFS&request=Getcapabilities"
 
         # point to cache path
-        if "BCDATA_CACHE" in os.environ:
-            self.cache_path = os.environ["BCDATA_CACHE"]
-        else:
-            self.cache_path = os.path.join(str(Path.home()), ".bcdata")
-        # if a file exists in the path provided AND the file name is .bcdata, delete it
-        p = Path(self.cache_path)
-        if p.is_file():
-            if self.cache_path[-7:] == ".bcdata":
-                p.unlink()
-            # if the file is named something else, prompt user to delete it
-            else:
-                raise RuntimeError(
-                    f"Cache file exists, delete before using bcdata: {self.cache_path}"
-                )
-        # create cache folder if it does not exist
-        p.mkdir(parents=True, exist_ok=True)
+        self.cache_path = get_cache_path()
         self.refresh = refresh
         self.cache_refresh_days = 30
         self.capabilities = self.get_capabilities()
@@ -86,7 +81,14 @@ class BCWFS(object):
             countdefault.find("ows:DefaultValue", {"ows": "http://www.opengis.net/ows/1.1"}).text
         )
 
-        self.request_headers = {"User-Agent": "bcdata.py ({bcdata.__version__})"}
+        # re-use connections (and TLS sessions) across requests
+        self.session = get_session()
+
+        # in-memory caches of table list / schemas, for re-use within a session
+        self._tables = None
+        self._table_set = None
+        self._schemas = {}
+        self._names = {}
 
     def check_cached_file(self, cache_file):
         """Return true if the file is empty / does not exist / is more than n days old"""
@@ -139,7 +141,7 @@ class BCWFS(object):
                 geom_column=geom_column,
             )
 
-        r = requests.get(self.wfs_url, params=payload, headers=self.request_headers)
+        r = self.session.get(self.wfs_url, params=payload)
         log.debug(r.url)
         if r.status_code in [400, 401, 404]:
             log.error(f"HTTP error {r.status_code}")
@@ -156,7 +158,7 @@ class BCWFS(object):
     @stamina.retry(on=requests.HTTPError, timeout=60)
     def _request_features(self, url, silent=False):
         """Submit a getfeature request to DataBC WFS and return feature collection"""
-        r = requests.get(url, headers=self.request_headers)
+        r = self.session.get(url)
         if not silent:
             log.info(r.url)
         else:
@@ -171,12 +173,12 @@ class BCWFS(object):
             log.warning(f"Response headers: {r.headers}")
             log.warning(f"Response text: {r.text}")
             r.raise_for_status()
-        return r.json()["features"]
+        return orjson.loads(r.content)["features"]
 
     @stamina.retry(on=requests.HTTPError, timeout=60)
     def _request_featurecollection(self, url, silent=False):
         """Submit a getfeature request to DataBC WFS and return feature collection"""
-        r = requests.get(url, headers=self.request_headers)
+        r = self.session.get(url)
         if not silent:
             log.info(r.url)
         else:
@@ -191,7 +193,7 @@ class BCWFS(object):
             log.warning(f"Response headers: {r.headers}")
             log.warning(f"Response text: {r.text}")
             r.raise_for_status()
-        return r.json()
+        return orjson.loads(r.content)
 
     def build_bounds_filter(self, query, bounds, bounds_crs, geom_column):
         """The bbox param shortcut is mutually exclusive with CQL_FILTER,
@@ -231,7 +233,9 @@ class BCWFS(object):
     def get_count(self, dataset, query=None, bounds=None, bounds_crs="EPSG:3005", geom_column=None):
         """Ask DataBC WFS how many features there are in a table/query/bounds"""
         table = self.validate_name(dataset)
-        geom_column = self.get_schema(table)["geometry_column"]
+        # geometry column name is only required for filtering by bounds
+        if bounds and not geom_column:
+            geom_column = self.get_schema(table)["geometry_column"]
         count = self._request_count(
             table,
             query=query,
@@ -242,6 +246,8 @@ class BCWFS(object):
         return count
 
     def get_schema(self, table):
+        if table in self._schemas:
+            return self._schemas[table]
         # download table definition if file is > 30 days old, empty, or refresh is specified
         if self.check_cached_file(table) or self.refresh:
             with open(os.path.join(self.cache_path, table), "w") as f:
@@ -249,16 +255,18 @@ class BCWFS(object):
                 f.write(json.dumps(schema, indent=4))
         # load cached schema
         with open(os.path.join(self.cache_path, table), "r") as f:
-            return json.loads(f.read())
+            self._schemas[table] = json.loads(f.read())
+        return self._schemas[table]
 
     def get_sortkey(self, table):
         """Check data for unique columns available for sorting paged requests"""
-        columns = list(self.get_schema(table)["properties"].keys())
         # use known primary key if it is present in the bcdata repository
+        # (checked first, no need to load the schema)
         if table.lower() in bcdata.primary_keys:
             return bcdata.primary_keys[table.lower()].upper()
+        columns = list(self.get_schema(table)["properties"].keys())
         # if pk not known, use OBJECTID as default sort key when present
-        elif "OBJECTID" in columns:
+        if "OBJECTID" in columns:
             return "OBJECTID"
         # if OBJECTID is not present (several GSR tables), use SEQUENCE_ID
         elif "SEQUENCE_ID" in columns:
@@ -273,19 +281,44 @@ class BCWFS(object):
 
     def list_tables(self):
         """read and parse capabilities xml, which lists all tables available"""
-        return [
+        if self._tables is None:
+            self._tables = self._list_tables()
+        return self._tables
+
+    def _list_tables(self):
+        # parsing the capabilities document is slow, cache the list of tables
+        # and re-use it until capabilities.xml is updated
+        capabilities_file = os.path.join(self.cache_path, "capabilities.xml")
+        tables_file = os.path.join(self.cache_path, "tables.json")
+        if (
+            not self.refresh
+            and os.path.exists(tables_file)
+            and os.path.getmtime(tables_file) >= os.path.getmtime(capabilities_file)
+            and os.stat(tables_file).st_size > 0
+        ):
+            with open(tables_file, "r") as f:
+                return json.loads(f.read())
+        tables = [
             i.strip("pub:")
             for i in list(
                 WebFeatureService(self.ows_url, version="2.0.0", xml=self.capabilities).contents
             )
         ]
+        with open(tables_file, "w") as f:
+            f.write(json.dumps(tables))
+        return tables
 
     def validate_name(self, dataset):
         """Check wfs/cache and the bcdc api to see if dataset name is valid"""
-        if dataset.upper() in self.list_tables():
-            return dataset.upper()
-        else:
-            return bcdata.get_table_name(dataset.upper())
+        # names are validated several times per request, remember the result
+        if dataset not in self._names:
+            if self._table_set is None:
+                self._table_set = frozenset(self.list_tables())
+            if dataset.upper() in self._table_set:
+                self._names[dataset] = dataset.upper()
+            else:
+                self._names[dataset] = bcdata.get_table_name(dataset.upper())
+        return self._names[dataset]
 
     def define_requests(
         self,
@@ -296,6 +329,7 @@ class BCWFS(object):
         count=None,
         sortby=None,
         check_count=True,
+        pagesize=None,
     ):
         """Translate provided parameters into a list of WFS request URLs required
         to download the dataset as specified
@@ -305,12 +339,17 @@ class BCWFS(object):
         - http://docs.geoserver.org/stable/en/user/services/wfs/vendor.html
         - http://docs.geoserver.org/latest/en/user/tutorials/cql/cql_tutorial.html
         """
+        if pagesize is not None and pagesize < 1:
+            raise ValueError(f"pagesize must be 1 or greater, got {pagesize}")
+
         # validate the table name
         table = self.validate_name(dataset)
 
-        # get name of the geometry column
-        schema = self.get_schema(table)
-        geom_column = schema["geometry_column"]
+        # get name of the geometry column (only required for filtering by bounds)
+        if bounds:
+            geom_column = self.get_schema(table)["geometry_column"]
+        else:
+            geom_column = None
 
         # find out how many records are in the table
         if not count and check_count is False:
@@ -327,6 +366,11 @@ class BCWFS(object):
                 bounds_crs=bounds_crs,
                 geom_column=geom_column,
             )
+            if not query and not bounds and count > LARGE_REQUEST_COUNT:
+                log.warning(
+                    f"Requesting all {count} features of {table}, "
+                    "consider filtering the request with a query or bounds"
+                )
         elif (
             count and check_count is True
         ):  # if provided a count that is bigger than actual number of records, automatically correct count
@@ -342,43 +386,46 @@ class BCWFS(object):
 
         log.info(f"Total features requested: {count}")
 
+        # requests can be made with a smaller page size than the server default/maximum
+        if pagesize is not None:
+            pagesize = min(pagesize, self.pagesize)
+        else:
+            pagesize = self.pagesize
+
         # for datasets with >10k records, generate a list of urls based on number of features in the dataset.
-        chunks = math.ceil(count / self.pagesize)
+        chunks = -(-count // pagesize)
 
         # if making several requests, we need to sort by something
         if chunks > 1 and not sortby:
             sortby = self.get_sortkey(table)
 
-        # build the request parameters for each chunk
-        urls = []
-        for i in range(chunks):
-            request = {
-                "service": "WFS",
-                "version": "2.0.0",
-                "request": "GetFeature",
-                "typeName": table,
-                "outputFormat": "json",
-                "SRSNAME": "EPSG:3005",  # just in case (this should always be the default)
-            }
-            if sortby:
-                request["sortby"] = sortby.upper()
-            if query or bounds:
-                request["CQL_FILTER"] = self.build_bounds_filter(
-                    query=query,
-                    bounds=bounds,
-                    bounds_crs=bounds_crs,
-                    geom_column=geom_column,
-                )
-            if chunks == 1:
-                request["count"] = count
-            if chunks > 1:
-                request["startIndex"] = i * self.pagesize
-                if count < (request["startIndex"] + self.pagesize):
-                    request["count"] = count - request["startIndex"]
-                else:
-                    request["count"] = self.pagesize
-            urls.append(self.wfs_url + "?" + urlencode(request, doseq=True))
-        return urls
+        # build the request parameters common to all chunks
+        request = {
+            "service": "WFS",
+            "version": "2.0.0",
+            "request": "GetFeature",
+            "typeName": table,
+            "outputFormat": "json",
+            "SRSNAME": "EPSG:3005",  # just in case (this should always be the default)
+        }
+        if sortby:
+            request["sortby"] = sortby.upper()
+        if query or bounds:
+            request["CQL_FILTER"] = self.build_bounds_filter(
+                query=query,
+                bounds=bounds,
+                bounds_crs=bounds_crs,
+                geom_column=geom_column,
+            )
+        base_url = self.wfs_url + "?" + urlencode(request, doseq=True)
+
+        # add paging parameters for each chunk
+        if chunks == 1:
+            return [base_url + "&" + urlencode({"count": count})]
+        return [
+            base_url + f"&startIndex={start_index}&count={min(pagesize, count - start_index)}"
+            for start_index in range(0, count, pagesize)
+        ]
 
     def request_features(
         self,
@@ -407,7 +454,41 @@ class BCWFS(object):
         if as_gdf:
             return gdf
         else:
-            return json.loads(gdf.to_json())
+            return orjson.loads(gdf.to_json())
+
+    def request_features_concurrent(self, urls, max_workers=MAX_WORKERS, **kwargs):
+        """
+        Make requests for each url in a pool of worker threads, yielding results in url order.
+        At most max_workers requests are in flight / held in memory at once.
+        """
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be 1 or greater, got {max_workers}")
+        # make sure there is a pooled connection available for each worker, replacing
+        # (and closing) the session's adapter only when a larger pool is needed
+        adapter = self.session.get_adapter(self.wfs_url)
+        if max_workers > adapter.poolmanager.connection_pool_kw["maxsize"]:
+            adapter.close()
+            self.session.mount("https://", HTTPAdapter(pool_maxsize=max_workers))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = deque()
+            try:
+                for url in urls:
+                    pending.append(executor.submit(self.request_features, url, **kwargs))
+                    if len(pending) >= max_workers:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # if a request fails (or the consumer stops early), do not wait for
+                # requests that have not yet started
+                for future in pending:
+                    future.cancel()
+
+
+@functools.lru_cache(maxsize=1)
+def get_wfs():
+    """Return a BCWFS instance shared by all calls within the session"""
+    return BCWFS()
 
 
 def get_data(
@@ -420,9 +501,11 @@ def get_data(
     as_gdf=False,
     lowercase=False,
     promote_to_multi=False,
+    max_workers=MAX_WORKERS,
+    pagesize=None,
 ):
     """Request features from DataBC WFS, returning GeoJSON featurecollection or geodataframe"""
-    WFS = BCWFS()
+    WFS = get_wfs()
     table = WFS.validate_name(dataset)
     urls = WFS.define_requests(
         table,
@@ -431,14 +514,17 @@ def get_data(
         bounds_crs=bounds_crs,
         count=count,
         sortby=sortby,
+        pagesize=pagesize,
     )
-    results = []
-    for url in urls:
-        results.append(
-            WFS.request_features(
-                url, as_gdf=True, lowercase=lowercase, promote_to_multi=promote_to_multi
-            )
+    results = list(
+        WFS.request_features_concurrent(
+            urls,
+            max_workers=max_workers,
+            as_gdf=True,
+            lowercase=lowercase,
+            promote_to_multi=promote_to_multi,
         )
+    )
     if len(results) > 1:
         gdf = pd.concat(results)
     elif len(results) == 1:
@@ -448,33 +534,62 @@ def get_data(
     if as_gdf:
         return gdf
     else:
-        return json.loads(gdf.to_json())
+        return orjson.loads(gdf.to_json())
 
 
-def get_count(dataset, query=None, bounds=None, bounds_crs="EPSG:3005"):
-    WFS = BCWFS()
+def get_features(
+    dataset,
+    query=None,
+    bounds=None,
+    bounds_crs="epsg:3005",
+    count=None,
+    sortby=None,
+    lowercase=False,
+    promote_to_multi=False,
+    max_workers=MAX_WORKERS,
+    pagesize=None,
+):
+    """Yield features from DataBC WFS as GeoJSON feature dicts, holding at most max_workers
+    pages in memory"""
+    WFS = get_wfs()
     table = WFS.validate_name(dataset)
-    geom_column = WFS.get_schema(table)["geometry_column"]
-    return WFS.get_count(
-        dataset,
+    urls = WFS.define_requests(
+        table,
         query=query,
         bounds=bounds,
         bounds_crs=bounds_crs,
-        geom_column=geom_column,
+        count=count,
+        sortby=sortby,
+        pagesize=pagesize,
     )
+    for featurecollection in WFS.request_features_concurrent(
+        urls,
+        max_workers=max_workers,
+        as_gdf=False,
+        lowercase=lowercase,
+        promote_to_multi=promote_to_multi,
+    ):
+        yield from featurecollection["features"]
+
+
+def get_count(dataset, query=None, bounds=None, bounds_crs="EPSG:3005"):
+    WFS = get_wfs()
+    return WFS.get_count(dataset, query=query, bounds=bounds, bounds_crs=bounds_crs)
 
 
 def get_sortkey(dataset):
-    WFS = BCWFS()
+    WFS = get_wfs()
     table = WFS.validate_name(dataset)
     return WFS.get_sortkey(table)
 
 
 def list_tables(refresh=False):
-    WFS = BCWFS(refresh)
-    return WFS.list_tables()
+    if refresh:
+        get_wfs.cache_clear()
+        return BCWFS(refresh).list_tables()
+    return get_wfs().list_tables()
 
 
 def validate_name(dataset):
-    WFS = BCWFS()
+    WFS = get_wfs()
     return WFS.validate_name(dataset)
@@ -29,6 +29,13 @@ def test_bc2pg():
     DB_CONNECTION.execute("drop table " + AIRPORTS_TABLE)
 
 
+def test_table_exists():
+    bcdata.bc2pg(AIRPORTS_TABLE, DB_URL, schema_only=True)
+    assert DB_CONNECTION.table_exists("whse_imagery_and_base_maps", "gsr_airports_svw")
+    DB_CONNECTION.execute("drop table " + AIRPORTS_TABLE)
+    assert not DB_CONNECTION.table_exists("whse_imagery_and_base_maps", "gsr_airports_svw")
+
+
 def test_bc2pg_50kgrid():
     bcdata.bc2pg("whse_basemapping.dbm_mof_50k_grid", DB_URL)
     assert "whse_basemapping.dbm_mof_50k_grid" in DB_CONNECTION.tables
@@ -208,3 +215,49 @@ def test_bc2pg_append_to_other():
     r = DB_CONNECTION.query("select * from whse_imagery_and_base_maps.arpt")
     assert len(r) == 2
     DB_CONNECTION.execute("drop table whse_imagery_and_base_maps.arpt")
+
+
+def interrupt_after(n_pages, monkeypatch):
+    """Make page downloads fail after n_pages, simulating an interrupted load"""
+    request_features_concurrent = bcdata.wfs.BCWFS.request_features_concurrent
+
+    def interrupted(self, urls, **kwargs):
+        pages = request_features_concurrent(self, urls, **kwargs)
+        for i, page in enumerate(pages):
+            if i == n_pages:
+                raise RuntimeError("Load interrupted")
+            yield page
+
+    monkeypatch.setattr(bcdata.wfs.BCWFS, "request_features_concurrent", interrupted)
+
+
+def test_bc2pg_resume(monkeypatch):
+    with monkeypatch.context() as m:
+        interrupt_after(1, m)
+        with pytest.raises(RuntimeError):
+            bcdata.bc2pg(ASSESSMENTS_TABLE, DB_URL, count=500, pagesize=100, max_workers=1)
+    # first page (requested when checking geometry type) and one more are written
+    r = DB_CONNECTION.query("select count(*) from whse_fish.pscis_assessment_svw")
+    assert r[0][0] == 200
+    bcdata.bc2pg(ASSESSMENTS_TABLE, DB_URL, count=500, pagesize=100, resume=True)
+    r = DB_CONNECTION.query(
+        "select count(*), count(distinct stream_crossing_id) from whse_fish.pscis_assessment_svw"
+    )
+    assert r[0][0] == 500
+    assert r[0][1] == 500
+    DB_CONNECTION.execute("drop table " + ASSESSMENTS_TABLE)
+
+
+def test_bc2pg_resume_changed_request(monkeypatch):
+    with monkeypatch.context() as m:
+        interrupt_after(1, m)
+        with pytest.raises(RuntimeError):
+            bcdata.bc2pg(ASSESSMENTS_TABLE, DB_URL, count=500, pagesize=100, max_workers=1)
+    # progress of a load with different parameters is not resumed, the table is reloaded
+    bcdata.bc2pg(ASSESSMENTS_TABLE, DB_URL, count=500, pagesize=200, resume=True)
+    r = DB_CONNECTION.query(
+        "select count(*), count(distinct stream_crossing_id) from whse_fish.pscis_assessment_svw"
+    )
+    assert r[0][0] == 500
+    assert r[0][1] == 500
+    DB_CONNECTION.execute("drop table " + ASSESSMENTS_TABLE)
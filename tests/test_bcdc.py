@@ -1,6 +1,8 @@
 import json
+import os
 
 import pytest
+import requests_mock
 
 import bcdata
 from bcdata import bcdc
@@ -78,3 +80,59 @@ def test_get_table_definition_nr_districts():
     assert table_definition["description"]
     assert table_definition["comments"]
     assert table_definition["schema"]
+
+
+AIRPORTS_PACKAGE_SHOW = {
+    "result": {
+        "resources": [
+            {
+                "format": "wms",
+                "url": f"https://openmaps.gov.bc.ca/geo/pub/{AIRPORTS_TABLE}/ows",
+            }
+        ]
+    }
+}
+
+
+def test_get_table_name_not_modified(tmp_path, monkeypatch):
+    # responses with a validator are cached, and re-used when the API replies 304
+    monkeypatch.setenv("BCDATA_CACHE", str(tmp_path))
+    with requests_mock.mock() as m:
+        m.get(
+            bcdc.BCDC_API_URL + "package_show",
+            [
+                {"json": AIRPORTS_PACKAGE_SHOW, "headers": {"ETag": '"abc"'}},
+                {"status_code": 304},
+            ],
+        )
+        assert bcdc.get_table_name(AIRPORTS_PACKAGE) == AIRPORTS_TABLE
+        assert len(list((tmp_path / "bcdc").glob("*.json"))) == 1
+        assert bcdc.get_table_name(AIRPORTS_PACKAGE) == AIRPORTS_TABLE
+        assert m.request_history[1].headers["If-None-Match"] == '"abc"'
+
+
+def test_get_table_name_invalid_cache(tmp_path, monkeypatch):
+    # an unreadable cache file is ignored and replaced
+    monkeypatch.setenv("BCDATA_CACHE", str(tmp_path))
+    cache_file = bcdc._cache_file(bcdc.BCDC_API_URL + "package_show", {"id": AIRPORTS_PACKAGE})
+    os.makedirs(os.path.dirname(cache_file))
+    with open(cache_file, "w") as f:
+        f.write('{"etag": "ab')
+    with requests_mock.mock() as m:
+        m.get(
+            bcdc.BCDC_API_URL + "package_show",
+            json=AIRPORTS_PACKAGE_SHOW,
+            headers={"ETag": '"abc"'},
+        )
+        assert bcdc.get_table_name(AIRPORTS_PACKAGE) == AIRPORTS_TABLE
+        assert "If-None-Match" not in m.request_history[0].headers
+    with open(cache_file, "r") as f:
+        assert json.load(f)["etag"] == '"abc"'
+
+
+def test_get_table_name_unexpected_status(tmp_path, monkeypatch):
+    monkeypatch.setenv("BCDATA_CACHE", str(tmp_path))
+    with requests_mock.mock() as m:
+        m.get(bcdc.BCDC_API_URL + "package_show", status_code=403)
+        with pytest.raises(bcdc.ServiceException):
+            bcdc.get_table_name(AIRPORTS_PACKAGE)
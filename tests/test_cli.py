@@ -74,6 +74,72 @@ def test_cat_bounds_ll():
     assert len(result.output.split("\n")) == 4
 
 
+def test_cat_rs():
+    runner = CliRunner()
+    result = runner.invoke(cli, ["cat", AIRPORTS_TABLE, "--count", 3, "--rs"])
+    assert result.exit_code == 0
+    # (str.splitlines() would also split on the RS character)
+    records = result.output.rstrip("\n").split("\n")
+    assert len(records) == 3
+    for record in records:
+        assert record.startswith("\x1e")
+        assert json.loads(record[1:])["type"] == "Feature"
+
+
+def parse_features(output):
+    """Parse (possibly indented) features written by cat"""
+    decoder = json.JSONDecoder()
+    features = []
+    output = output.strip()
+    while output:
+        feature, end = decoder.raw_decode(output)
+        features.append(feature)
+        output = output[end:].strip()
+    return features
+
+
+def test_cat_sort_keys():
+    # orjson and standard library json paths write the same features,
+    # with keys sorted only when requested
+    runner = CliRunner()
+    outputs = {}
+    for indent in [[], ["--indent", "2"], ["--indent", "4"]]:
+        for compact in [[], ["--compact"]]:
+            for sort_keys in [[], ["--sort-keys"]]:
+                result = runner.invoke(
+                    cli, ["cat", AIRPORTS_TABLE, "--count", 3] + indent + compact + sort_keys
+                )
+                assert result.exit_code == 0
+                features = parse_features(result.output)
+                assert len(features) == 3
+                outputs[(tuple(indent), bool(compact), bool(sort_keys))] = features
+    for (indent, compact, sort_keys), features in outputs.items():
+        assert features == outputs[((), False, False)]
+        for feature in features:
+            keys = list(feature.keys())
+            properties = list(feature["properties"].keys())
+            if sort_keys:
+                assert keys == sorted(keys)
+                assert properties == sorted(properties)
+            else:
+                assert keys == list(outputs[((), False, False)][0].keys())
+
+
+def test_cat_indent_compact():
+    runner = CliRunner()
+    for indent in ["2", "4"]:
+        result = runner.invoke(
+            cli, ["cat", AIRPORTS_TABLE, "--count", 1, "--indent", indent, "--compact"]
+        )
+        assert result.exit_code == 0
+        assert '"type":"Feature"' in result.output
+        assert '": ' not in result.output
+        assert "\n" + " " * int(indent) + '"' in result.output
+    result = runner.invoke(cli, ["cat", AIRPORTS_TABLE, "--count", 1, "--indent", "2"])
+    assert result.exit_code == 0
+    assert '"type": "Feature"' in result.output
+
+
 def test_dump():
     runner = CliRunner()
     result = runner.invoke(cli, ["dump", AIRPORTS_TABLE, "--count", 1])
@@ -82,6 +148,19 @@ def test_dump():
     assert len(json.loads(result.output)["features"]) == 1
 
 
+def test_dump_out_file(tmp_path):
+    out_file = tmp_path / "airports.geojson"
+    runner = CliRunner()
+    result = runner.invoke(cli, ["dump", AIRPORTS_TABLE, "--count", 3, "-o", str(out_file)])
+    assert result.exit_code == 0
+    assert result.output == ""
+    with open(out_file, "r") as f:
+        data = json.load(f)
+    assert data["type"] == "FeatureCollection"
+    assert len(data["features"]) == 3
+    assert data["crs"]["properties"]["name"] == "urn:ogc:def:crs:EPSG::3005"
+
+
 def test_bc2pg():
     runner = CliRunner()
     result = runner.invoke(cli, ["bc2pg", AIRPORTS_TABLE, "--db_url", DB_URL])
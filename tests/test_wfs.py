@@ -1,10 +1,15 @@
+import json
+import os
+
 import pytest
 import requests
 import requests_mock
 import stamina
 from geopandas.geodataframe import GeoDataFrame
+from shapely.geometry import LineString, MultiPoint, MultiPolygon, Point, Polygon
 
 import bcdata
+from bcdata.bc2pg import get_geometry_type
 
 AIRPORTS_PACKAGE = "bc-airports"
 AIRPORTS_TABLE = "WHSE_IMAGERY_AND_BASE_MAPS.GSR_AIRPORTS_SVW"
@@ -109,6 +114,27 @@ def test_get_data_paged_count():
     assert len(data["features"]) == count
 
 
+def test_define_requests_pagesize():
+    wfs = bcdata.wfs.BCWFS()
+    urls = wfs.define_requests(AIRPORTS_TABLE)
+    urls_paged = wfs.define_requests(AIRPORTS_TABLE, pagesize=100)
+    assert len(urls_paged) > len(urls)
+    assert len(urls_paged) == -(-bcdata.get_count(AIRPORTS_TABLE) // 100)
+
+
+def test_define_requests_pagesize_invalid():
+    wfs = bcdata.wfs.BCWFS()
+    for pagesize in [0, -1]:
+        with pytest.raises(ValueError):
+            wfs.define_requests(AIRPORTS_TABLE, pagesize=pagesize)
+
+
+def test_get_features():
+    features = list(bcdata.get_features(AIRPORTS_TABLE, count=10))
+    assert len(features) == 10
+    assert features[0]["type"] == "Feature"
+
+
 def test_get_data_sortby():
     data = bcdata.get_data(AIRPORTS_TABLE, count=1, sortby="AIRPORT_NAME")
     assert data["features"][0]["properties"]["AIRPORT_NAME"] == "100 Mile House Airport"
@@ -139,3 +165,68 @@ def test_cql_bounds_filter():
     )
     assert len(data["features"]) == 1
     assert data["features"][0]["properties"]["AIRPORT_NAME"] == "Victoria International Airport"
+
+
+def test_promote_gdf_to_multi():
+    square = Polygon([(0, 0), (0, 1), (1, 1), (1, 0)])
+    df = GeoDataFrame(
+        {"id": [1, 2, 3, 4]},
+        geometry=[square, MultiPolygon([square, square.buffer(-0.25)]), None, square],
+        crs="EPSG:3005",
+    )
+    df = bcdata.wfs.promote_gdf_to_multi(df)
+    assert list(df.geom_type[df.geometry.notna()]) == ["MultiPolygon"] * 3
+    assert df.geometry[0].geoms[0].equals(square)
+    assert len(df.geometry[1].geoms) == 2
+    assert df.geometry[2] is None
+    assert df.crs == "EPSG:3005"
+
+
+def test_get_geometry_type_mixed():
+    # type of the first non-null geometry is returned
+    square = Polygon([(0, 0), (0, 1), (1, 1), (1, 0)])
+    df = GeoDataFrame(geometry=[None, Point(0, 0), MultiPoint([(0, 0), (1, 1)])])
+    assert get_geometry_type(df) == "POINT"
+    df = GeoDataFrame(geometry=[MultiPolygon([square]), square])
+    assert get_geometry_type(df) == "MULTIPOLYGON"
+    df = GeoDataFrame(geometry=[None, LineString([(0, 0, 1), (1, 1, 2)])])
+    assert get_geometry_type(df) == "LINESTRINGZ"
+
+
+def test_get_geometry_type_null():
+    assert get_geometry_type(GeoDataFrame(geometry=[None, None])) is None
+    assert get_geometry_type(GeoDataFrame(geometry=[])) is None
+
+
+def test_primary_keys_offline(tmp_path, monkeypatch):
+    # a stale cached copy is used when the refresh fails
+    monkeypatch.setenv("BCDATA_CACHE", str(tmp_path))
+    cached_keys = {ASSESSMENTS_TABLE: "stream_crossing_id"}
+    primary_keys_file = tmp_path / "primary_keys.json"
+    primary_keys_file.write_text(json.dumps(cached_keys))
+    stale = primary_keys_file.stat().st_mtime - bcdata.PRIMARY_KEY_CACHE_SECONDS - 1
+    os.utime(primary_keys_file, (stale, stale))
+    with requests_mock.mock() as m:
+        m.get(bcdata.PRIMARY_KEY_DB_URL, exc=requests.exceptions.ConnectionError)
+        assert bcdata.load_primary_keys() == cached_keys
+
+
+def test_primary_keys_offline_no_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("BCDATA_CACHE", str(tmp_path))
+    with requests_mock.mock() as m:
+        m.get(bcdata.PRIMARY_KEY_DB_URL, exc=requests.exceptions.ConnectionError)
+        with pytest.raises(RuntimeError, match="Failed to download primary key database"):
+            bcdata.load_primary_keys()
+
+
+def test_primary_keys_invalid_cache(tmp_path, monkeypatch):
+    # an unreadable cached copy is replaced with a fresh download
+    monkeypatch.setenv("BCDATA_CACHE", str(tmp_path))
+    primary_keys_file = tmp_path / "primary_keys.json"
+    primary_keys_file.write_text('{"whse_fish.pscis_')
+    keys = {ASSESSMENTS_TABLE: "stream_crossing_id"}
+    with requests_mock.mock() as m:
+        m.get(bcdata.PRIMARY_KEY_DB_URL, json=keys)
+        assert bcdata.load_primary_keys() == keys
+    assert json.loads(primary_keys_file.read_text()) == keys
+    assert list(tmp_path.glob("*.tmp")) == []